@@ -1,10 +1,15 @@
 import asyncio
-import json
+import io
 import os
+import random
 import sys
+import time
+from collections import OrderedDict
 from contextlib import AsyncExitStack
 from typing import List
 
+import orjson
+from aioconsole import ainput
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 from mcp.client.sse import sse_client
@@ -12,6 +17,15 @@ from openai import AsyncOpenAI
 
 
 class MCPClient:
+    # 工具结果缓存配置：最大条目数与各工具的TTL（秒），未列出的工具使用默认TTL
+    TOOL_CACHE_MAXSIZE = 256
+    TOOL_CACHE_TTL = {"get_weather": 600.0, "get_alerts": 60.0}
+    TOOL_CACHE_DEFAULT_TTL = 300.0
+    # 写入对话历史的单条工具结果上限（字符数），防止大结果在后续每轮请求中重复膨胀token
+    MAX_TOOL_RESULT_CHARS = 2000
+    # SSE连接失败时的最大重试次数（指数退避）
+    SSE_CONNECT_MAX_RETRIES = 5
+
     def __init__(self, model_name: str, base_url: str, api_key: str, server_sources: List[str]):
         """
         初始化 MCP 客户端，用于管理多个子进程服务器的工具调用。
@@ -24,6 +38,11 @@ class MCPClient:
         self.server_sources = server_sources
         self.sessions = {}  # 存储每个服务器的会话：server_id -> session
         self.tool_mapping = {}  # 工具映射：prefixed_name -> (session, original_tool_name)
+        self.available_tools = []  # 缓存的工具描述列表（OpenAI function 格式），初始化时构建
+        self._tool_cache = OrderedDict()  # 工具结果缓存：(prefixed_name, 参数JSON) -> (时间戳, 结果)
+        self._no_cache_tools = set()  # 描述中标注 @no_cache 的工具，不参与结果缓存
+        self._initialized = False  # 会话是否已初始化，防止未初始化就处理查询
+        self._warmup = None  # LLM连接预热任务，在初始化会话时并行发起
         self.exit_stack = AsyncExitStack()  # 用于管理多个异步上下文的资源
         self.client = AsyncOpenAI(base_url=base_url, api_key=api_key)
 
@@ -32,57 +51,170 @@ class MCPClient:
         初始化所有子进程服务器的会话，建立工具映射关系。
         为每个Python脚本创建一个子进程，并通过标准输入输出流与之通信。
         """
+        # 与子进程启动并行预热LLM连接，把DNS+TCP+TLS开销隐藏在初始化过程中
+        self._warmup = asyncio.create_task(self._warmup_llm_connection())
+        # 先依次启动所有子进程（spawn本身不等待子进程就绪，开销很小）
+        pending = []  # [(server_id, session)]
         for i, server_source in enumerate(self.server_sources):
             server_params = StdioServerParameters(
                 command="python",
                 args=[server_source],
-                env=None
+                # 子进程不写.pyc且不缓冲输出，加快启动和stdio通信
+                env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1", "PYTHONUNBUFFERED": "1"},
             )
             server_id = f"server{i}"
             # 创建标准输入输出流通信通道
             write, read = await self.exit_stack.enter_async_context(stdio_client(server_params))
-            # 初始化客户端会话
+            # 创建客户端会话
             session = await self.exit_stack.enter_async_context(ClientSession(write, read))
-            await session.initialize()
-            # 存储会话实例
+            pending.append((server_id, session))
+        # 并发完成各子进程的MCP握手：冷启动耗时取决于最慢的子进程而非各进程之和
+        await asyncio.gather(*[session.initialize() for _, session in pending])
+        # 存储会话实例
+        for server_id, session in pending:
             self.sessions[server_id] = session
-            # 获取服务器提供的工具列表并建立映射关系
-            response = await session.list_tools()
-            for tool in response.tools:
-                prefixed_name = f"{server_id}_{tool.name}"  # 添加服务器前缀以区分不同服务器的同名工具
-                self.tool_mapping[prefixed_name] = (session, tool.name)
-            print(f"\n已连接到服务器 {server_id}，支持以下工具:", [tool.name for tool in response.tools])
+        # 并发获取所有服务器的工具列表，整体耗时取决于最慢的服务器而非各服务器之和
+        await self._register_all_tools()
+        self._initialized = True
 
     async def initialize_sessions_sse(self):
         """
         初始化所有SSE服务器的会话，建立工具映射关系。
         通过SSE连接与服务器建立通信，获取可用工具列表并建立映射。
         """
+        # 与SSE连接建立并行预热LLM连接，把DNS+TCP+TLS开销隐藏在初始化过程中
+        self._warmup = asyncio.create_task(self._warmup_llm_connection())
         for i, server_source in enumerate(self.server_sources):
             server_id = f"server{i}"
 
-            # 创建标准输入输出流通信通道
-            write, read = await self.exit_stack.enter_async_context(sse_client(url=server_source))
-
-            # 初始化客户端会话
-            session = await self.exit_stack.enter_async_context(ClientSession(write, read))
-            await session.initialize()
+            # 建立SSE连接（瞬时网络故障时带退避重试）
+            session = await self._connect_sse_with_retry(server_source)
 
             # 存储会话实例
             self.sessions[server_id] = session
 
-            # 获取服务器提供的工具列表并建立映射关系
-            response = await session.list_tools()
+        # 并发获取所有服务器的工具列表，整体耗时取决于最慢的服务器而非各服务器之和
+        await self._register_all_tools()
+        self._initialized = True
+
+    async def _connect_sse_with_retry(self, url: str):
+        """
+        带指数退避的SSE连接：瞬时网络故障时自动重试而非直接放弃初始化。
+        退避时长为 min(2^n, 30) 秒加随机抖动，避免多客户端同时重连形成冲击。
+        :param url: SSE服务器地址
+        :return: 已完成 initialize 的 ClientSession
+        """
+        for attempt in range(self.SSE_CONNECT_MAX_RETRIES):
+            # 每次尝试用独立的exit stack承载资源，失败时立即释放，不污染客户端的exit_stack
+            stack = AsyncExitStack()
+            try:
+                # 创建SSE通信通道并初始化客户端会话
+                write, read = await stack.enter_async_context(sse_client(url=url))
+                session = await stack.enter_async_context(ClientSession(write, read))
+                await session.initialize()
+            except Exception as e:
+                await stack.aclose()
+                if attempt == self.SSE_CONNECT_MAX_RETRIES - 1:
+                    raise
+                delay = min(2 ** attempt, 30) + random.uniform(0, 1)
+                print(f"连接SSE服务器 {url} 失败（第{attempt + 1}次）: {e}，{delay:.1f}秒后重试")
+                await asyncio.sleep(delay)
+            else:
+                # 连接成功后才把本次资源移交给客户端的exit_stack统一清理
+                self.exit_stack.push_async_callback(stack.pop_all().aclose)
+                return session
+
+    async def __aenter__(self):
+        """
+        异步上下文管理器入口：进入时完成会话初始化。
+        子进程在整个上下文期间保持存活，避免每次调用重新fork+握手。
+        """
+        await self.initialize_sessions()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """
+        异步上下文管理器出口：退出时清理所有会话和连接资源。
+        """
+        await self.cleanup()
+
+    async def _warmup_llm_connection(self):
+        """
+        预热到LLM端点的连接：用一次轻量请求提前完成DNS+TCP+TLS握手，
+        连接留在httpx连接池中供首次 chat.completions.create 复用。
+        预热失败不影响正常流程，首次请求会自行建连。
+        """
+        try:
+            await self.client.models.list()
+        except Exception as e:
+            print(f"LLM连接预热失败（首次请求将自行建连）: {e}")
+
+    async def _register_all_tools(self):
+        """
+        并发调用各会话的 list_tools，建立工具映射并缓存工具描述。
+        每次初始化只构建一次目录，重复初始化时先清空旧缓存避免重复条目。
+        单个服务器失败时只跳过该服务器，不影响其他服务器。
+        """
+        self.tool_mapping.clear()
+        self.available_tools.clear()
+        self._no_cache_tools.clear()
+        responses = await asyncio.gather(
+            *[session.list_tools() for session in self.sessions.values()],
+            return_exceptions=True,
+        )
+        for (server_id, session), response in zip(self.sessions.items(), responses):
+            if isinstance(response, BaseException):
+                print(f"\n获取服务器 {server_id} 工具列表失败: {response}")
+                continue
             for tool in response.tools:
                 prefixed_name = f"{server_id}_{tool.name}"  # 添加服务器前缀以区分不同服务器的同名工具
                 self.tool_mapping[prefixed_name] = (session, tool.name)
-
+                if "@no_cache" in (tool.description or ""):
+                    self._no_cache_tools.add(prefixed_name)
+                # 缓存工具描述，避免每次查询都重新调用 list_tools
+                self.available_tools.append({
+                    "type": "function",
+                    "function": {
+                        "name": prefixed_name,
+                        "description": tool.description,
+                        "parameters": tool.inputSchema,
+                    },
+                })
             print(f"\n已连接到服务器 {server_id}，支持以下工具:", [tool.name for tool in response.tools])
 
+    async def _call_tool_cached(self, prefixed_name: str, session, original_tool_name: str, tool_args: dict):
+        """
+        带结果缓存的工具调用：幂等工具（如天气查询）在TTL内重复调用直接返回缓存结果。
+        :param prefixed_name: 带服务器前缀的工具名，作为缓存键的一部分
+        :param session: 工具所属的服务器会话
+        :param original_tool_name: 服务器端的原始工具名
+        :param tool_args: 工具调用参数字典
+        :return: 工具调用结果（缓存命中时省去一次MCP往返）
+        """
+        if prefixed_name in self._no_cache_tools:
+            return await session.call_tool(original_tool_name, tool_args)
+        key = (prefixed_name, orjson.dumps(tool_args, option=orjson.OPT_SORT_KEYS))
+        ttl = self.TOOL_CACHE_TTL.get(original_tool_name, self.TOOL_CACHE_DEFAULT_TTL)
+        cached = self._tool_cache.get(key)
+        if cached is not None:
+            timestamp, result = cached
+            if time.monotonic() - timestamp < ttl:
+                self._tool_cache.move_to_end(key)  # LRU：命中后移到末尾
+                return result
+            del self._tool_cache[key]  # 已过期，删除后重新调用
+        result = await session.call_tool(original_tool_name, tool_args)
+        self._tool_cache[key] = (time.monotonic(), result)
+        if len(self._tool_cache) > self.TOOL_CACHE_MAXSIZE:
+            self._tool_cache.popitem(last=False)  # 淘汰最久未使用的条目
+        return result
+
     async def cleanup(self):
         """
         清理所有会话和连接资源
         """
+        self._initialized = False
+        if self._warmup is not None and not self._warmup.done():
+            self._warmup.cancel()
         await self.exit_stack.aclose()
 
     async def chat_loop(self):
@@ -93,84 +225,118 @@ class MCPClient:
         print("\nMCP 客户端已启动，输入你的问题，输入 'quit' 退出。")
         while True:
             try:
-                query = input("\n问题: ").strip()
+                # 异步读取输入，用户打字期间事件循环仍可执行后台任务（如SSE心跳、缓存刷新）
+                query = (await ainput("\n问题: ")).strip()
                 if query.lower() == "quit":
                     break
-                response = await self.process_query(query)
-                print("\n" + response)
+                # 回复内容在 process_query 中流式输出，这里无需再打印
+                await self.process_query(query)
             except Exception as e:
                 print(f"\n发生错误: {str(e)}")
 
+    async def _stream_completion(self, messages):
+        """
+        以流式方式请求模型回复，内容增量一到达就输出，降低首字延迟。
+        同时跨分片累积 tool_calls（函数名和参数JSON分散在多个分片中）。
+        :param messages: 发送给模型的对话消息列表
+        :return: (完整回复文本, 组装完成的工具调用字典列表)
+        """
+        stream = await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            tools=self.available_tools,
+            stream=True,
+        )
+        content_parts = []
+        tool_calls = []  # 按 index 累积：[{"id", "type", "function": {"name", "arguments"}}]
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                print(delta.content, end="", flush=True)
+                content_parts.append(delta.content)
+            for tc in delta.tool_calls or []:
+                while len(tool_calls) <= tc.index:
+                    tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+                entry = tool_calls[tc.index]
+                if tc.id:
+                    entry["id"] = tc.id
+                if tc.function and tc.function.name:
+                    entry["function"]["name"] += tc.function.name
+                if tc.function and tc.function.arguments:
+                    entry["function"]["arguments"] += tc.function.arguments
+        if content_parts:
+            print()
+        return "".join(content_parts), tool_calls
+
     async def process_query(self, query: str) -> str:
         """
         处理用户的自然语言查询，通过工具调用完成任务并返回结果。
         :param query: 用户输入的查询字符串
         :return: 处理后的回复文本，包含模型回复和工具调用结果
         """
+        if not self._initialized:
+            raise RuntimeError("请先调用 initialize_sessions() 或 initialize_sessions_sse() 初始化会话")
         messages = [{"role": "user", "content": query}]  # 初始化对话消息列表
-        # 收集所有可用工具的信息
-        available_tools = []
-        for server_id, session in self.sessions.items():
-            response = await session.list_tools()
-            for tool in response.tools:
-                prefixed_name = f"{server_id}_{tool.name}"
-                available_tools.append({
-                    "type": "function",
-                    "function": {
-                        "name": prefixed_name,
-                        "description": tool.description,
-                        "parameters": tool.inputSchema,
-                    },
-                })
-        # 向语言模型发送初始请求
-        response = await self.client.chat.completions.create(
-            model=self.model_name,
-            messages=messages,
-            tools=available_tools,
-        )
-        final_text = []  # 存储所有回复内容
-        message = response.choices[0].message
-        final_text.append(message.content or "")  # 添加模型的初始回复
+        # 向语言模型发送初始请求（流式），内容增量即时输出
+        content, tool_calls = await self._stream_completion(messages)
+        buf = io.StringIO()  # 流式写入回复内容，避免累积大量短字符串对象
+        buf.write(content or "")  # 添加模型的初始回复
+        buf.write("\n")
         # 处理模型请求的工具调用
-        while message.tool_calls:
-            for tool_call in message.tool_calls:
-                prefixed_name = tool_call.function.name
+        while tool_calls:
+            # 收集本轮可执行的工具调用：(tool_call, session, 原始工具名, 参数)
+            executable = []
+            for tool_call in tool_calls:
+                prefixed_name = tool_call["function"]["name"]
                 if prefixed_name in self.tool_mapping:
                     session, original_tool_name = self.tool_mapping[prefixed_name]
-                    tool_args = json.loads(tool_call.function.arguments)
-                    try:
-                        # 执行工具调用
-                        result = await session.call_tool(original_tool_name, tool_args)
-                    except Exception as e:
-                        result = {"content": f"调用工具 {original_tool_name} 出错：{str(e)}"}
-                        print(result["content"])
-                    final_text.append(f"[调用工具 {prefixed_name} 参数: {tool_args}]")
-                    final_text.append(f"工具结果: {result.content}")
-                    # 将工具调用结果添加到对话历史
-                    messages.extend([
-                        {
-                            "role": "assistant",
-                            "tool_calls": [{
-                                "id": tool_call.id,
-                                "type": "function",
-                                "function": {"name": prefixed_name, "arguments": json.dumps(tool_args)},
-                            }],
-                        },
-                        {"role": "tool", "tool_call_id": tool_call.id, "content": str(result.content)},
-                    ])
+                    tool_args = orjson.loads(tool_call["function"]["arguments"])
+                    executable.append((tool_call, session, original_tool_name, tool_args))
                 else:
                     print(f"工具 {prefixed_name} 未找到")
-                    final_text.append(f"工具 {prefixed_name} 未找到")
-            # 获取工具调用后的模型回复
-            response = await self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                tools=available_tools,
+                    buf.write(f"工具 {prefixed_name} 未找到\n")
+            # 并发执行本轮所有工具调用，总耗时取决于最慢的工具而非各工具之和
+            results = await asyncio.gather(
+                *[self._call_tool_cached(tc["function"]["name"], session, name, args)
+                  for tc, session, name, args in executable],
+                return_exceptions=True,
             )
-            message = response.choices[0].message
-            if message.content:
-                final_text.append(message.content)
-        return "\n".join(final_text)
+            # 按模型请求的原始顺序追加结果，保持对话历史的因果顺序
+            for (tool_call, session, original_tool_name, tool_args), result in zip(executable, results):
+                prefixed_name = tool_call["function"]["name"]
+                if isinstance(result, BaseException):
+                    content = f"调用工具 {original_tool_name} 出错：{str(result)}"
+                    print(content)
+                else:
+                    content = result.content
+                print(f"[调用工具 {prefixed_name} 参数: {tool_args}]")
+                print(f"工具结果: {content}")
+                buf.write(f"[调用工具 {prefixed_name} 参数: {tool_args}]\n")
+                buf.write(f"工具结果: {content}\n")
+                # 写入历史前截断过长结果：历史会在后续每轮请求中重复发送，完整结果仍保留在 buf
+                history_content = str(content)
+                if len(history_content) > self.MAX_TOOL_RESULT_CHARS:
+                    history_content = history_content[:self.MAX_TOOL_RESULT_CHARS] + "…（结果过长已截断）"
+                # 将工具调用结果添加到对话历史
+                messages.extend([
+                    {
+                        "role": "assistant",
+                        "tool_calls": [{
+                            "id": tool_call["id"],
+                            "type": "function",
+                            "function": {"name": prefixed_name, "arguments": orjson.dumps(tool_args).decode()},
+                        }],
+                    },
+                    {"role": "tool", "tool_call_id": tool_call["id"], "content": history_content},
+                ])
+            # 获取工具调用后的模型回复（同样流式输出）
+            content, tool_calls = await self._stream_completion(messages)
+            if content:
+                buf.write(content)
+                buf.write("\n")
+        return buf.getvalue().rstrip("\n")
 
 
 async def main():
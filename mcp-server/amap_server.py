@@ -1,12 +1,67 @@
-import json
+import asyncio
+import atexit
 import os
-import requests
+import httpx
+import orjson
 from dotenv import load_dotenv, find_dotenv
 from mcp.server.fastmcp import FastMCP
 
 _ = load_dotenv(find_dotenv())
 mcp = FastMCP("WeatherServer", port=9999)
 
+# 启动时读取并校验一次配置：省去每次调用的环境变量查找，密钥缺失时快速失败
+_AMAP_KEY = os.getenv("AMAP_MAPS_API_KEY")
+if not _AMAP_KEY:
+    raise RuntimeError("未找到高德地图API密钥，请检查环境变量AMAP_MAPS_API_KEY")
+_API_URL = 'https://restapi.amap.com/v3/weather/weatherInfo'
+
+# 返回结果中保留的预报字段，与API返回的字段名一致
+_FIELDS = ('date', 'dayweather', 'nightweather', 'daytemp', 'nighttemp',
+           'daywind', 'nightwind', 'daypower', 'nightpower')
+
+# 模块级共享客户端：复用连接池，避免每次调用重建TCP/TLS连接
+# http2=True 允许多个请求复用同一TCP连接，gzip压缩减少JSON传输字节数
+_client = httpx.AsyncClient(
+    http2=True,
+    headers={"Accept-Encoding": "gzip"},
+    timeout=10.0,
+)
+atexit.register(lambda: asyncio.run(_client.aclose()))
+
+# 进行中的请求：city -> Future。并发到达的相同城市查询共享同一次HTTP调用
+_pending: dict[str, asyncio.Future] = {}
+
+
+async def _fetch_weather(city: str) -> list[dict]:
+    """实际发起高德天气API请求并解析预报数据"""
+    # 构造请求参数（密钥和URL已在模块加载时准备好）
+    params = {
+        'key': _AMAP_KEY,
+        'city': city,
+        'extensions': 'all',
+        'output': 'json'
+    }
+
+    try:
+        # 发送异步请求，不阻塞事件循环，其他工具调用可并发执行
+        response = await _client.get(_API_URL, params=params)
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+
+        # 验证API响应
+        if data.get('status') != '1':
+            raise ValueError(f"API错误:{data.get('info','未知错误')}")
+        if not data.get('forecasts'):
+            raise ValueError("未获取到天气预报数据")
+
+        # 解析返回数据：按 _FIELDS 投影每天的预报字段
+        casts = data['forecasts'][0]['casts']
+        return [{field: cast.get(field) for field in _FIELDS} for cast in casts]
+    except httpx.HTTPError as e:
+        raise httpx.HTTPError(f"网络请求失败:{str(e)}")
+    except orjson.JSONDecodeError as e:
+        raise ValueError(f"API响应格式错误:{str(e)}")
+
 
 @mcp.tool()
 async def get_weather(city: str) -> list[dict]:
@@ -31,58 +86,32 @@ async def get_weather(city: str) -> list[dict]:
 
     Raises:
         ValueError: 当参数无效或API返回错误时
-        RequestException: 当网络请求失败时
+        HTTPError: 当网络请求失败时
     """
     # 参数验证
     if not city:
         raise ValueError("city参数不能为空")
 
-    api_key = os.getenv("AMAP_MAPS_API_KEY")
-
-    if not api_key:
-        raise ValueError("未找到高德地图API密钥，请检查环境变量AMAP_MAPS_API_KEY")
-
-    # 构造请求参数
-    params = {
-        'key': api_key,
-        'city': city,
-        'extensions': 'all',
-        'output': 'json'
-    }
-    url = 'https://restapi.amap.com/v3/weather/weatherInfo'
-
+    # 合并并发的相同城市查询：后到者直接等待先发请求的结果，减少HTTP调用次数
+    pending = _pending.get(city)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    future = asyncio.get_running_loop().create_future()
+    _pending[city] = future
     try:
-        # 发送请求
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-
-        # 验证API响应
-        if data.get('status') != '1':
-            raise ValueError(f"API错误:{data.get('info','未知错误')}")
-        if not data.get('forecasts'):
-            raise ValueError("未获取到天气预报数据")
-
-        # 解析返回数据
-        casts = data['forecasts'][0]['casts']
-        result = []
-        for cast in casts:
-            result.append({
-                'date': cast.get('date'),
-                'dayweather': cast.get('dayweather'),
-                'nightweather': cast.get('nightweather'),
-                'daytemp': cast.get('daytemp'),
-                'nighttemp': cast.get('nighttemp'),
-                'daywind': cast.get('daywind'),
-                'nightwind': cast.get('nightwind'),
-                'daypower': cast.get('daypower'),
-                'nightpower': cast.get('nightpower')
-            })
+        result = await _fetch_weather(city)
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # 标记异常已被消费，避免无等待者时的告警
+        raise
+    else:
+        future.set_result(result)
         return result
-    except requests.exceptions.RequestException as e:
-        raise requests.exceptions.RequestException(f"网络请求失败:{str(e)}")
-    except json.JSONDecodeError as e:
-        raise ValueError(f"API响应格式错误:{str(e)}")
+    finally:
+        # 领头请求被取消时（CancelledError不走上面的except），同步取消等待者，避免其永久挂起
+        if not future.done():
+            future.cancel()
+        _pending.pop(city, None)
 
 if __name__ == "__main__":
     mcp.run(transport="stdio")
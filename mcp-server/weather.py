@@ -1,3 +1,6 @@
+import asyncio
+import atexit
+import time
 from typing import Any
 import httpx
 from mcp.server.fastmcp import FastMCP
@@ -7,32 +10,47 @@ mcp = FastMCP("weather")
 NWS_API_BASE = "https://api.weather.gov"
 USER_AGENT = "weather-app/1.0"
 
+# 模块级共享客户端：连接池和keep-alive跨调用复用，省去每次请求的TCP+TLS建连开销
+# http2=True 允许多个请求复用同一TCP连接，gzip压缩大幅减少JSON传输字节数
+_nws_client = httpx.AsyncClient(
+    http2=True,
+    headers={
+        "User-Agent": USER_AGENT,
+        "Accept": "application/geo+json",
+        "Accept-Encoding": "gzip",
+    },
+    timeout=30.0,
+)
+atexit.register(lambda: asyncio.run(_nws_client.aclose()))
+
+# 坐标 -> 预报URL 缓存：points到forecast的映射基本静态，缓存后重复查询省去一次HTTP往返
+# 超过容量上限时淘汰最早写入的条目，避免不重复的坐标让缓存无限增长
+_points_cache: dict[tuple[float, float], tuple[float, str]] = {}
+_POINTS_CACHE_TTL = 24 * 3600.0  # 24小时
+_POINTS_CACHE_MAXSIZE = 256
+
 
 async def make_nws_request(url: str) -> dict[str, Any] | None:
     """向 NWS API 发送请求，并进行错误处理"""
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/geo+json"
-    }
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            return response.json()
-        except Exception:
-            return None
+    try:
+        response = await _nws_client.get(url)
+        response.raise_for_status()
+        return response.json()
+    except Exception:
+        return None
 
 
 def format_alert(feature: dict) -> str:
     """将天气警报格式化为可读的字符串"""
     props = feature["properties"]
-    return f"""
-            事件: {props.get('event', '未知')}
-            地区: {props.get('areaDesc', '未知')}
-            严重程度: {props.get('severity', '未知')}
-            描述: {props.get('description', '无描述')}
-            指引: {props.get('instruction', '无具体指引')}
-            """
+    # 逐行拼接而非三引号块：输出不携带源代码缩进空格，减少发送给模型的token
+    return "\n".join([
+        f"事件: {props.get('event', '未知')}",
+        f"地区: {props.get('areaDesc', '未知')}",
+        f"严重程度: {props.get('severity', '未知')}",
+        f"描述: {props.get('description', '无描述')}",
+        f"指引: {props.get('instruction', '无具体指引')}",
+    ])
 
 
 @mcp.tool()
@@ -58,13 +76,22 @@ async def get_forecast(latitude: float, longitude: float) -> str:
         latitude: 纬度
         longitude: 经度
     """
-    # 获取天气预报的 API 端点
-    points_url = f"{NWS_API_BASE}/points/{latitude},{longitude}"
-    points_data = await make_nws_request(points_url)
-    if not points_data:
-        return "无法获取该位置的天气预报数据。"
-    # 获取天气预报 URL
-    forecast_url = points_data["properties"]["forecast"]
+    # 先查缓存：同一坐标在TTL内直接复用预报URL，跳过 /points 请求
+    cache_key = (round(latitude, 3), round(longitude, 3))
+    cached = _points_cache.get(cache_key)
+    if cached and time.monotonic() - cached[0] < _POINTS_CACHE_TTL:
+        forecast_url = cached[1]
+    else:
+        # 获取天气预报的 API 端点
+        points_url = f"{NWS_API_BASE}/points/{latitude},{longitude}"
+        points_data = await make_nws_request(points_url)
+        if not points_data:
+            return "无法获取该位置的天气预报数据。"
+        # 获取天气预报 URL 并写入缓存
+        forecast_url = points_data["properties"]["forecast"]
+        _points_cache[cache_key] = (time.monotonic(), forecast_url)
+        if len(_points_cache) > _POINTS_CACHE_MAXSIZE:
+            _points_cache.pop(next(iter(_points_cache)))  # 淘汰最早写入的条目
     forecast_data = await make_nws_request(forecast_url)
     if not forecast_data:
         return "无法获取详细的天气预报信息。"
@@ -72,12 +99,13 @@ async def get_forecast(latitude: float, longitude: float) -> str:
     periods = forecast_data["properties"]["periods"]
     forecasts = []
     for period in periods[:5]:  # 仅显示最近 5 个时段的预报
-        forecast = f"""
-                    {period['name']}:
-                    温度: {period['temperature']}°{period['temperatureUnit']}
-                    风速: {period['windSpeed']} {period['windDirection']}
-                    天气: {period['detailedForecast']}
-                    """
+        # 逐行拼接而非三引号块：输出不携带源代码缩进空格，减少发送给模型的token
+        forecast = "\n".join([
+            f"{period['name']}:",
+            f"温度: {period['temperature']}°{period['temperatureUnit']}",
+            f"风速: {period['windSpeed']} {period['windDirection']}",
+            f"天气: {period['detailedForecast']}",
+        ])
         forecasts.append(forecast)
     return "\n---\n".join(forecasts)
 